@@ -26,10 +26,22 @@ import json
 import sys
 import csv
 import os
-from typing import Dict, Optional, Tuple, List
+import sqlite3
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 import argparse
 import datetime
 import concurrent.futures
+import multiprocessing
+import multiprocessing.util
+import collections
+import contextlib
+import cProfile
+import logging
+import pstats
+import shutil
+import threading
+import time
+import tracemalloc
 
 
 def get_json(url: str, headers: dict, max_retries: int = 3, timeout: int = 20):
@@ -67,13 +79,12 @@ def get_all_ports() -> List[str]:
         "IDCXP", "IDBJU", "IDCEB", "IDLBR", "IDKUM", "IDSMQ", "IDSTU"
     ]
 
-def scrape_pkk_list(kode_pelabuhan: str, tahun: int, bulan: int, jenis: str) -> list:
+def fetch_pkk_list(kode_pelabuhan: str, tahun: int, bulan: int, jenis: str) -> list:
+    """Daftar nomor PKK satu pelabuhan/bulan/jenis; error diteruskan ke pemanggil."""
     url = f"https://monitoring-inaportnet.dephub.go.id/monitoring/byPort/list/{kode_pelabuhan}/{jenis}/{tahun}/{bulan:02d}"
-    try:
+    # dipanggil paralel dari thread (RunScheduler.list_units): hanya waktu yang dicatat
+    with PROFILER.stage("list", sync=False):
         payload = get_json(url, HEADERS)
-    except Exception as e:
-        print(f"[WARN] Gagal JSON {jenis} {tahun}-{bulan:02d}: {e}")
-        return []
     data = payload.get("data") or []
     return [item.get("nomor_pkk") for item in data if item.get("nomor_pkk")]
 
@@ -84,30 +95,348 @@ HEADERS = {
 }
 
 
-async def fetch_page_async(session: aiohttp.ClientSession, url: str, params: dict) -> Optional[str]:
+# ---------------------------------------------------------------------------
+# Profiling (--profile): cProfile + waktu per tahap + slow callback asyncio;
+# tracemalloc per tahap hanya dengan --profile-memory (overhead-nya besar)
+# ---------------------------------------------------------------------------
+
+PROFILE_STAGES = ("list", "fetch", "parse", "unpivot", "write")
+PROFILE_SNAPSHOT_EVERY = 50   # ambil snapshot tracemalloc tiap N panggilan per tahap
+PROFILE_TOP_SITES = 10
+SLOW_CALLBACK_SECONDS = 0.1
+
+
+# abaikan alokasi milik profiler sendiri
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, contextlib.__file__),
+]
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Tangkap peringatan 'Executing <Handle ...> took X seconds' dari asyncio debug mode."""
+
+    def __init__(self, sink: list):
+        super().__init__(logging.WARNING)
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord):
+        msg = record.getMessage()
+        if " took " in msg:
+            self.sink.append(msg)
+
+
+class StageProfiler:
+    """
+    Profiler per proses. Nonaktif secara default: stage() hanya mengembalikan
+    nullcontext sehingga run normal tidak terbebani. tracemalloc melacak
+    seluruh proses dan memperlambat run berkali lipat, jadi hanya dinyalakan
+    jika memory=True; waktu dan slow callback dari run seperti itu tidak
+    mencerminkan beban sebenarnya.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self._profile = None
+        self._handler = None
+        self.stages: Dict[str, dict] = {}
+        self.slow_callbacks: List[str] = []
+        # tahap "list" dijalankan dari beberapa thread sekaligus
+        self._lock = threading.Lock()
+
+    def start(self, memory: bool = False):
+        self.enabled = True
+        self.memory = memory
+        self.stages = {name: {"count": 0, "seconds": 0.0, "memory": False, "peak_bytes": 0, "sites": {}} for name in PROFILE_STAGES}
+        self.slow_callbacks = []
+        self._handler = _SlowCallbackHandler(self.slow_callbacks)
+        logging.getLogger("asyncio").addHandler(self._handler)
+        if memory:
+            tracemalloc.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, out_dir: str, label: str):
+        """Hentikan profiling dan tulis <label>.prof + <label>.json ke out_dir."""
+        if not self.enabled:
+            return
+        self._profile.disable()
+        peak = None
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        logging.getLogger("asyncio").removeHandler(self._handler)
+        self.enabled = False
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f"{label}-{os.getpid()}")
+        self._profile.dump_stats(base + ".prof")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump({"label": label, "memory": self.memory, "peak_bytes": peak, "stages": self.stages,
+                       "slow_callbacks": self.slow_callbacks}, f, ensure_ascii=False)
+
+    def stage(self, name: str, sync: bool = True):
+        """
+        Context manager untuk satu tahap. Untuk tahap sinkron (tanpa await di
+        dalamnya) peak memori dan lokasi alokasi bisa diatribusikan ke tahap ini;
+        untuk tahap async (fetch) hanya waktu yang dicatat.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._measure(name, sync)
+
+    @contextlib.contextmanager
+    def _measure(self, name: str, sync: bool):
+        st = self.stages[name]
+        with self._lock:
+            st["count"] += 1
+            count = st["count"]
+        snapshot = None
+        sync = sync and self.memory
+        if sync:
+            st["memory"] = True
+            tracemalloc.reset_peak()
+            start_mem, _ = tracemalloc.get_traced_memory()
+            if count % PROFILE_SNAPSHOT_EVERY == 1:
+                snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                st["seconds"] += elapsed
+            if sync:
+                _, peak = tracemalloc.get_traced_memory()
+                st["peak_bytes"] = max(st["peak_bytes"], peak - start_mem)
+                if snapshot is not None:
+                    after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+                    for diff in after.compare_to(snapshot, "lineno")[:PROFILE_TOP_SITES]:
+                        if diff.size_diff > 0:
+                            site = str(diff.traceback)
+                            st["sites"][site] = st["sites"].get(site, 0) + diff.size_diff
+
+
+PROFILER = StageProfiler()
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024 or unit == "GiB":
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def write_profile_report(profile_dir: str, report_path: str, top_n: int = 40):
+    """Gabungkan hasil profiling semua proses di profile_dir menjadi satu file laporan."""
+    prof_files = sorted(os.path.join(profile_dir, f) for f in os.listdir(profile_dir) if f.endswith(".prof"))
+    json_files = sorted(os.path.join(profile_dir, f) for f in os.listdir(profile_dir) if f.endswith(".json"))
+
+    stages = {name: {"count": 0, "seconds": 0.0, "memory": False, "peak_bytes": 0, "sites": {}} for name in PROFILE_STAGES}
+    workers = []
+    slow_callbacks = []
+    memory = False
+    for path in json_files:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        memory = memory or data.get("memory", False)
+        workers.append((data["label"], data["peak_bytes"]))
+        slow_callbacks.extend(f"[{data['label']}] {m}" for m in data["slow_callbacks"])
+        for name, st in data["stages"].items():
+            agg = stages[name]
+            agg["count"] += st["count"]
+            agg["seconds"] += st["seconds"]
+            agg["memory"] = agg["memory"] or st.get("memory", False)
+            agg["peak_bytes"] = max(agg["peak_bytes"], st["peak_bytes"])
+            for site, size in st["sites"].items():
+                agg["sites"][site] = agg["sites"].get(site, 0) + size
+
+    with open(report_path, "w", encoding="utf-8") as out:
+        out.write("=" * 80 + "\nINAPORT PROFILE REPORT\n" + "=" * 80 + "\n")
+        out.write(f"Dibuat: {datetime.datetime.now().isoformat(timespec='seconds')}\n")
+        out.write(f"Proses: {len(workers)}\n")
+        out.write("Catatan: cProfile menambah overhead per panggilan fungsi, terutama pada tahap CPU (parse).\n")
+        if memory:
+            out.write("Mode memori (tracemalloc): waktu dan slow callback di bawah ikut melambat karena tracing.\n")
+        out.write("\n")
+
+        out.write("Tahap (waktu dijumlah dari semua proses/task; fetch tumpang tindih secara konkuren)\n")
+        out.write(f"  {'tahap':<8} {'jumlah':>8} {'detik':>10} {'peak/panggilan':>16}\n")
+        for name in PROFILE_STAGES:
+            st = stages[name]
+            # tahap async (fetch) dan list (thread) tidak diukur memorinya
+            peak = _fmt_bytes(st["peak_bytes"]) if st["memory"] else "n/a"
+            out.write(f"  {name:<8} {st['count']:>8} {st['seconds']:>10.2f} {peak:>16}\n")
+
+        if memory:
+            out.write("\nPeak tracemalloc per proses\n")
+            for label, peak in workers:
+                out.write(f"  {label:<20} {_fmt_bytes(peak) if peak is not None else 'n/a'}\n")
+
+            out.write(f"\nLokasi alokasi teratas per tahap (sampel tiap {PROFILE_SNAPSHOT_EVERY} panggilan)\n")
+            for name in PROFILE_STAGES:
+                sites = sorted(stages[name]["sites"].items(), key=lambda kv: kv[1], reverse=True)[:PROFILE_TOP_SITES]
+                if not sites:
+                    continue
+                out.write(f"  [{name}]\n")
+                for site, size in sites:
+                    out.write(f"    {_fmt_bytes(size):>12}  {site}\n")
+        else:
+            out.write("\n(memori per tahap tidak diukur; jalankan terpisah dengan --profile-memory)\n")
+
+        out.write(f"\nAsyncio slow callbacks (> {SLOW_CALLBACK_SECONDS}s, memblokir event loop): {len(slow_callbacks)}\n")
+        for msg in slow_callbacks[:top_n]:
+            out.write(f"  {msg}\n")
+
+        out.write("\n" + "-" * 80 + "\ncProfile gabungan (cumulative)\n" + "-" * 80 + "\n")
+        if prof_files:
+            stats = pstats.Stats(*prof_files, stream=out)
+            stats.sort_stats("cumulative").print_stats(top_n)
+    return report_path
+
+
+# Batas waktu request detail (detik). Bisa diubah lewat --connect-timeout/--read-timeout/--request-timeout.
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 60.0
+
+
+def make_client_timeout(connect: float = CONNECT_TIMEOUT, read: float = READ_TIMEOUT,
+                        total: float = REQUEST_TIMEOUT) -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(total=total, connect=connect, sock_connect=connect, sock_read=read)
+
+
+class LatencyHedger:
+    """
+    Hedged request untuk memangkas ekor latensi: jika request detail belum
+    selesai setelah persentil latensi yang dipelajari selama run, kirim
+    request duplikat dan ambil jawaban yang datang lebih dulu.
+    Jumlah hedge dibatasi max_rate dari total request.
+    """
+
+    def __init__(self, percentile: float = 95.0, max_rate: float = 0.05, min_samples: int = 20, window: int = 500):
+        if not 0 < percentile < 100:
+            raise ValueError(f"percentile harus di antara 0 dan 100, bukan {percentile}")
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._cached_delay: Optional[float] = None
+
+    def record(self, seconds: float):
+        self.latencies.append(seconds)
+        self._cached_delay = None
+
+    def hedge_delay(self) -> Optional[float]:
+        # None = belum cukup sampel, jangan hedge
+        if len(self.latencies) < self.min_samples:
+            return None
+        if self._cached_delay is None:
+            ordered = sorted(self.latencies)
+            idx = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+            self._cached_delay = ordered[idx]
+        return self._cached_delay
+
+    def allow_hedge(self) -> bool:
+        return self.hedges < self.max_rate * self.requests
+
+    def summary(self) -> str:
+        delay = self.hedge_delay()
+        delay_txt = f"{delay:.2f}s" if delay is not None else "n/a"
+        return (f"hedge p{self.percentile:g}={delay_txt}, {self.hedges}/{self.requests} request di-hedge, "
+                f"{self.hedge_wins} dimenangkan hedge")
+
+
+async def _fetch_once(session: aiohttp.ClientSession, url: str, params: dict,
+                      hedger: Optional[LatencyHedger] = None) -> Optional[str]:
+    t0 = time.perf_counter()
+    text = None
     try:
-        async with session.get(url, params=params) as resp:
-            if resp.status != 200:
-                return None
-            return await resp.text()
+        with PROFILER.stage("fetch", sync=False):
+            async with session.get(url, params=params) as resp:
+                if resp.status == 200:
+                    text = await resp.text()
     except Exception:
+        # termasuk asyncio.TimeoutError dari batas connect/read
+        pass
+    # gagal/timeout juga dicatat pada durasinya, supaya persentil tidak hanya
+    # dihitung dari request yang berhasil (request yang di-cancel tidak sampai sini)
+    if hedger is not None:
+        hedger.record(time.perf_counter() - t0)
+    return text
+
+
+async def fetch_page_async(session: aiohttp.ClientSession, url: str, params: dict,
+                           hedger: Optional[LatencyHedger] = None) -> Optional[str]:
+    if hedger is None:
+        return await _fetch_once(session, url, params)
+
+    hedger.requests += 1
+    primary = asyncio.ensure_future(_fetch_once(session, url, params, hedger))
+    tasks = [primary]
+    try:
+        delay = hedger.hedge_delay()
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not hedger.allow_hedge():
+            return await primary
+
+        hedger.hedges += 1
+        backup = asyncio.ensure_future(_fetch_once(session, url, params, hedger))
+        tasks.append(backup)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result is not None:
+                    if task is backup:
+                        hedger.hedge_wins += 1
+                    return result
         return None
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
 
-async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
+class PkkFetchError(Exception):
+    """Halaman detail PKK gagal diambil (timeout, error jaringan, atau status non-200)."""
+
+
+async def fetch_pkk_record(session: aiohttp.ClientSession, npk: str,
+                           hedger: Optional[LatencyHedger] = None,
+                           raise_on_fetch_error: bool = False) -> Optional[dict]:
+    """
+    Ambil dan parse halaman detail satu PKK menjadi record lengkap:
+    judul, info kapal, tanggal, ringkasan status, dan SEMUA baris layanan.
+    Record ini dipakai untuk CSV (lihat record_to_rows) dan untuk SQLite (--db).
+
+    None berarti halaman tidak berisi PKK; gagal fetch juga None, kecuali
+    raise_on_fetch_error=True (PkkFetchError).
+    """
     params = {"nomor_pkk": npk}
-    html_text = await fetch_page_async(session, BASE_URL, params)
+    html_text = await fetch_page_async(session, BASE_URL, params, hedger)
     if not html_text:
-        return []
+        if raise_on_fetch_error:
+            raise PkkFetchError(f"gagal mengambil detail {npk} dari upstream")
+        return None
 
-    soup = BeautifulSoup(html_text, 'html.parser')
+    with PROFILER.stage("parse"):
+        soup = BeautifulSoup(html_text, 'html.parser')
 
-    # Extract title
-    title = extract_title(soup)
-    if not title:
-        return []
+        # Extract title
+        title = extract_title(soup)
+        if not title:
+            return None
 
-    # Extract ship_info and dates
-    ship_info, dates, status, other_services = extract_ship_info_and_dates(soup)
+        # Extract ship_info and dates
+        services = extract_services(soup)
+        ship_info, dates, status, other_services = extract_ship_info_and_dates(soup, services)
 
     # Parse title
     if " - " in title:
@@ -116,33 +445,79 @@ async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
         no_pkk = title
         nama_kapal = ""
 
-    # Extract specific columns
-    bendera_call_imo = ship_info.get("Bendera / Call Sign / IMO", "")
-    parts = [x.strip() for x in bendera_call_imo.split(" / ")]
-    bendera = parts[0] if len(parts) > 0 else ""
-    # call_sign = parts[1] if len(parts) > 1 else ""  # Removed
-    # imo = parts[2] if len(parts) > 2 else ""  # Removed
-
-    gt_dwt = ship_info.get("GT / DWT", "")
-    parts = [x.strip() for x in gt_dwt.split(" / ")]
-    gt = parts[0] if len(parts) > 0 else ""
-    dwt = parts[1] if len(parts) > 1 else ""
-
-    draft = ship_info.get("Draft Depan / Belakang / Max", "")
-    parts = [x.strip() for x in draft.split(" / ")]
-    # draft_depan = parts[0] if len(parts) > 0 else ""  # Removed
-    # belakang = parts[1] if len(parts) > 1 else ""  # Removed
-    max_draft = parts[2] if len(parts) > 2 else ""
-
-    panjang_lebar = ship_info.get("Panjang / Lebar", "")
-    parts = [x.strip() for x in panjang_lebar.split(" / ")]
-    # panjang = parts[0] if len(parts) > 0 else ""  # Removed
-    lebar = parts[1] if len(parts) > 1 else ""
+    return {
+        "no_pkk": no_pkk.strip(),
+        "nama_kapal": nama_kapal.strip(),
+        "ship_info": ship_info,
+        "dates": dates,
+        "status": status,
+        "other_services": other_services,
+        "services": services,
+    }
+
+
+async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
+    record = await fetch_pkk_record(session, npk)
+    if not record:
+        return []
+    return record_to_rows(record)
+
+
+def _split_slash(value: str, n: int) -> List[str]:
+    # "a / b / c" -> ["a", "b", "c"], selalu panjang n (kosong jika tidak ada)
+    parts = [x.strip() for x in value.split(" / ")] if value else []
+    return (parts + [""] * n)[:n]
+
+
+PELINDO_VERIFIKATORS = [
+    "PT. PELABUHAN INDONESIA (Persero)",
+    "PT PELABUHAN INDONESIA (PERSERO) REGIONAL 2 PONTIANAK",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 2 BANTEN",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 3 Tj. Emas",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Gresik",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. MAKASSAR",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. BALIKPAPAN",
+    "PT PELINDO JASA MARITIM",
+    "PT. PELABUHAN INDONESIA (Persero) CABANG KUPANG",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Belawan",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Palembang",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. TERNATE",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. KENDARI",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Pulau Ba'ai",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. TARAKAN",
+    "PELABUHAN INDONESIA",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Tanjung Pandan",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. AMBON",
+    "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. GORONTALO",
+    "KANTOR KESYAHBANDARAN DAN OTORITAS PELABUHAN UTAMA TANJUNG PRIOK",
+    "PT. PELABUHAN INDONESIA (Persero) Batulicin",
+    "PT. Pelabuhan Indonesia (Persero) Regional 1 Cabang Dumai",
+    "PT. PELABUHAN INDONESIA (Persero) CABANG SATUI",
+    "PT. PELABUHAN INDONESIA (Persero) CABANG SAMPIT",
+    "PT Pelabuhan Indonesia",
+    "PT. PELABUHAN INDONESIA (Persero) CABANG LEMBAR",
+    "PT. PELABUHAN INDONESIA (Persero) Cab. Cilacap",
+    "PT. PELABUHAN INDONESIA (Persero) CABANG TANJUNG WANGI",
+    "PT PELABUHAN INDONESIA (PERSERO)"
+]
+
+
+def kategori_spk(verifikator: str) -> str:
+    return "PELINDO" if verifikator in PELINDO_VERIFIKATORS else "NON PELINDO"
+
+
+def record_to_rows(record: dict) -> List[dict]:
+    """Unpivot record PKK menjadi baris CSV (hanya layanan SPK PANDU)."""
+    ship_info = record["ship_info"]
+    dates = record["dates"]
+    status = record["status"]
+
+    gt, _dwt = _split_slash(ship_info.get("GT / DWT", ""), 2)
 
     # Common fields
     common = {
-        "No PKK": no_pkk,
-        "Nama Kapal": nama_kapal,
+        "No PKK": record["no_pkk"],
+        "Nama Kapal": record["nama_kapal"],
         "ETA": dates.get("ETA", ""),
         "ETD": dates.get("ETD", ""),
         "Nama Perusahaan": ship_info.get("Nama Perusahaan", ""),
@@ -167,45 +542,10 @@ async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
         arrival_row["Waktu SPK"] = waktu if waktu else ""
     else:
         arrival_row["Waktu SPK"] = ""
-    # Add kategori SPK
-    pelindo_verifikators = [
-        "PT. PELABUHAN INDONESIA (Persero)",
-        "PT PELABUHAN INDONESIA (PERSERO) REGIONAL 2 PONTIANAK",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 2 BANTEN",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 3 Tj. Emas",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Gresik",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. MAKASSAR",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. BALIKPAPAN",
-        "PT PELINDO JASA MARITIM",
-        "PT. PELABUHAN INDONESIA (Persero) CABANG KUPANG",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Belawan",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Palembang",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. TERNATE",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. KENDARI",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Pulau Ba'ai",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. TARAKAN",
-        "PELABUHAN INDONESIA",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Tanjung Pandan",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. AMBON",
-        "PT. PELABUHAN INDONESIA (PERSERO) REGIONAL 4 CAB. GORONTALO",
-        "KANTOR KESYAHBANDARAN DAN OTORITAS PELABUHAN UTAMA TANJUNG PRIOK",
-        "PT. PELABUHAN INDONESIA (Persero) Batulicin",
-        "PT. Pelabuhan Indonesia (Persero) Regional 1 Cabang Dumai",
-        "PT. PELABUHAN INDONESIA (Persero) CABANG SATUI",
-        "PT. PELABUHAN INDONESIA (Persero) CABANG SAMPIT",
-        "PT Pelabuhan Indonesia",
-        "PT. PELABUHAN INDONESIA (Persero) CABANG LEMBAR",
-        "PT. PELABUHAN INDONESIA (Persero) Cab. Cilacap",
-        "PT. PELABUHAN INDONESIA (Persero) CABANG TANJUNG WANGI",
-        "PT PELABUHAN INDONESIA (PERSERO)"
-    ]
-    
+
     # Filter hanya untuk layanan SPK PANDU
     if arrival_row["Layanan"] == "SPK PANDU":
-        if arrival_row["Verifikator"] in pelindo_verifikators:
-            arrival_row["Kategori SPK"] = "PELINDO"
-        else:
-            arrival_row["Kategori SPK"] = "NON PELINDO"
+        arrival_row["Kategori SPK"] = kategori_spk(arrival_row["Verifikator"])
         rows.append(arrival_row)
 
     # Departure row
@@ -224,14 +564,11 @@ async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
         departure_row["Waktu SPK"] = ""
     # Filter hanya untuk layanan SPK PANDU
     if departure_row["Layanan"] == "SPK PANDU":
-        if departure_row["Verifikator"] in pelindo_verifikators:
-            departure_row["Kategori SPK"] = "PELINDO"
-        else:
-            departure_row["Kategori SPK"] = "NON PELINDO"
+        departure_row["Kategori SPK"] = kategori_spk(departure_row["Verifikator"])
         rows.append(departure_row)
 
     # Other services (e.g., ship movement)
-    for other_service in other_services:
+    for other_service in record["other_services"]:
         other_row = common.copy()
         other_row["Tipe"] = other_service.get("Layanan", "Lainnya")
         other_row["Layanan"] = other_service.get("Layanan", "")
@@ -247,10 +584,7 @@ async def process_pkk(session: aiohttp.ClientSession, npk: str) -> List[dict]:
             other_row["Waktu SPK"] = ""
         # Filter hanya untuk layanan SPK PANDU
         if other_row["Layanan"] == "SPK PANDU":
-            if other_row["Verifikator"] in pelindo_verifikators:
-                other_row["Kategori SPK"] = "PELINDO"
-            else:
-                other_row["Kategori SPK"] = "NON PELINDO"
+            other_row["Kategori SPK"] = kategori_spk(other_row["Verifikator"])
             rows.append(other_row)
 
     return rows
@@ -322,7 +656,51 @@ def table_to_dict(table_tag) -> Dict[str, str]:
     return data
 
 
-def extract_ship_info_and_dates(soup: BeautifulSoup) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str], List[dict]]:
+ARRIVAL_SERVICES = ('RPKRO', 'PPK', 'PKK', 'SPM')
+DEPARTURE_SERVICES = ('SPOG', 'SPB', 'SPK PANDU')
+
+
+def extract_services(soup: BeautifulSoup) -> List[dict]:
+    """
+    Ambil SEMUA baris layanan dari tabel layanan (tabel 2,3,4,5, dll).
+    Setiap baris diberi "Kelompok" (Kedatangan/Keberangkatan/Lainnya) dan
+    "Urutan" (posisi di dalam kelompoknya, mulai 0).
+    """
+    services = []
+    counters = {"Kedatangan": 0, "Keberangkatan": 0, "Lainnya": 0}
+    tables = soup.find_all("table")
+    for table in tables[1:]:  # Skip table 0 (ship info), check others
+        table_dict = table_to_dict(table)
+        if 'Layanan' in table_dict or any('Layanan' in str(row) for row in table.find_all("tr")):
+            # This is a service table
+            rows = table.find_all("tr")
+            for row in rows[1:]:  # Skip header
+                cols = [c.get_text(" ", strip=True) for c in row.find_all(["th", "td"])]
+                if len(cols) >= 5:
+                    if cols[0] in ARRIVAL_SERVICES:
+                        kelompok = "Kedatangan"
+                    elif cols[0] in DEPARTURE_SERVICES:
+                        kelompok = "Keberangkatan"
+                    else:  # Other services like ship movement
+                        kelompok = "Lainnya"
+                    services.append({
+                        "Layanan": cols[0],
+                        "Waktu Permohonan": cols[1],
+                        "Waktu Persetujuan": cols[2],
+                        "Proses": cols[3],
+                        "Status": cols[4],
+                        "Verifikator": cols[5] if len(cols) > 5 else "",
+                        "Nomor Produk": cols[6] if len(cols) > 6 else "",
+                        "Lokasi Sandar": cols[7] if len(cols) > 7 else "",
+                        "Status Integrasi": cols[8] if len(cols) > 8 else "",
+                        "Kelompok": kelompok,
+                        "Urutan": counters[kelompok],
+                    })
+                    counters[kelompok] += 1
+    return services
+
+
+def extract_ship_info_and_dates(soup: BeautifulSoup, services: Optional[List[dict]] = None) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str], List[dict]]:
     tables = soup.find_all("table")
     ship_info = {}
     dates = {}
@@ -354,35 +732,12 @@ def extract_ship_info_and_dates(soup: BeautifulSoup) -> Tuple[Dict[str, str], Di
         for k, v in second.items():
             if k not in ["ETA", "ETD"]:  # Avoid duplicates
                 dates[k] = v
-    # Ambil status pelayanan dari tabel layanan (tabel 2,3,4,5, dll)
-    arrival_services = []
-    departure_services = []
-    other_services = []
-    for table in tables[1:]:  # Skip table 0 (ship info), check others
-        table_dict = table_to_dict(table)
-        if 'Layanan' in table_dict or any('Layanan' in str(row) for row in table.find_all("tr")):
-            # This is a service table
-            rows = table.find_all("tr")
-            for row in rows[1:]:  # Skip header
-                cols = [c.get_text(" ", strip=True) for c in row.find_all(["th", "td"])]
-                if len(cols) >= 5:
-                    service_info = {
-                        "Layanan": cols[0],
-                        "Waktu Permohonan": cols[1],
-                        "Waktu Persetujuan": cols[2],
-                        "Proses": cols[3],
-                        "Status": cols[4],
-                        "Verifikator": cols[5] if len(cols) > 5 else "",
-                        "Nomor Produk": cols[6] if len(cols) > 6 else "",
-                        "Lokasi Sandar": cols[7] if len(cols) > 7 else "",
-                        "Status Integrasi": cols[8] if len(cols) > 8 else ""
-                    }
-                    if cols[0] in ['RPKRO', 'PPK', 'PKK', 'SPM']:  # Arrival services
-                        arrival_services.append(service_info)
-                    elif cols[0] in ['SPOG', 'SPB', 'SPK PANDU']:  # Departure services
-                        departure_services.append(service_info)
-                    else:  # Other services like ship movement
-                        other_services.append(service_info)
+    # Ambil status pelayanan dari tabel layanan (bisa diberikan dari extract_services)
+    if services is None:
+        services = extract_services(soup)
+    arrival_services = [s for s in services if s["Kelompok"] == "Kedatangan"]
+    departure_services = [s for s in services if s["Kelompok"] == "Keberangkatan"]
+    other_services = [s for s in services if s["Kelompok"] == "Lainnya"]
     # Summarize status
     status["Status Kedatangan"] = "; ".join([s["Status"] for s in arrival_services]) if arrival_services else ""
     status["Status Keberangkatan"] = "; ".join([s["Status"] for s in departure_services]) if departure_services else ""
@@ -588,6 +943,276 @@ def save_table_as_json_csv(soup: BeautifulSoup, json_path: str = "hasil_scrap.js
         print(f"Failed to save table to files: {exc}")
 
 
+# ---------------------------------------------------------------------------
+# SQLite store (opsional, --db): tabel ternormalisasi kapal / kunjungan / layanan
+# ---------------------------------------------------------------------------
+
+CSV_COLUMNS = [
+    "No PKK", "Nama Kapal", "ETA", "ETD", "Nama Perusahaan", "GT", "Jenis Trayek", "Singgah",
+    "Tipe", "Layanan", "Verifikator", "Nomor Produk", "Lokasi Sandar", "Nomor SPK", "Waktu SPK",
+    "Kategori SPK",
+]
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vessels (
+    vessel_key      TEXT PRIMARY KEY,   -- IMO; fallback 'CS:<call sign>' / 'NAMA:<nama>' (data kunjungan terbaru)
+    imo             TEXT,
+    call_sign       TEXT,
+    nama_kapal      TEXT,
+    bendera         TEXT,
+    gt              TEXT,
+    dwt             TEXT,
+    panjang         TEXT,
+    lebar           TEXT,
+    draft_depan     TEXT,
+    draft_belakang  TEXT,
+    draft_max       TEXT,
+    last_seen       TEXT,               -- periode 'YYYY-MM' kunjungan asal data di atas
+    updated_at      TEXT
+);
+CREATE TABLE IF NOT EXISTS port_calls (
+    no_pkk                TEXT PRIMARY KEY,
+    vessel_key            TEXT REFERENCES vessels(vessel_key),
+    nama_kapal            TEXT,
+    kode_pelabuhan        TEXT,
+    tahun                 INTEGER,
+    bulan                 INTEGER,
+    jenis                 TEXT,
+    nama_perusahaan       TEXT,
+    eta                   TEXT,
+    etd                   TEXT,
+    jenis_trayek          TEXT,
+    singgah               TEXT,
+    gt                    TEXT,         -- data kapal saat kunjungan ini
+    dwt                   TEXT,
+    draft_depan           TEXT,
+    draft_belakang        TEXT,
+    draft_max             TEXT,
+    status_kedatangan     TEXT,
+    status_keberangkatan  TEXT,
+    detail_json           TEXT,
+    updated_at            TEXT
+);
+CREATE TABLE IF NOT EXISTS services (
+    no_pkk             TEXT NOT NULL REFERENCES port_calls(no_pkk) ON DELETE CASCADE,
+    kelompok           TEXT NOT NULL,
+    urutan             INTEGER NOT NULL,
+    layanan            TEXT,
+    waktu_permohonan   TEXT,
+    waktu_persetujuan  TEXT,
+    proses             TEXT,
+    status             TEXT,
+    verifikator        TEXT,
+    nomor_produk       TEXT,
+    lokasi_sandar      TEXT,
+    status_integrasi   TEXT,
+    kategori_spk       TEXT,
+    PRIMARY KEY (no_pkk, kelompok, urutan)
+);
+CREATE INDEX IF NOT EXISTS idx_port_calls_periode ON port_calls(kode_pelabuhan, tahun, bulan, jenis);
+CREATE INDEX IF NOT EXISTS idx_port_calls_vessel ON port_calls(vessel_key);
+CREATE INDEX IF NOT EXISTS idx_vessels_imo ON vessels(imo);
+CREATE INDEX IF NOT EXISTS idx_services_layanan ON services(layanan, verifikator);
+
+-- Tampilan yang sama persis dengan kolom ina.csv: layanan SPK PANDU dari layanan
+-- pertama kedatangan/keberangkatan dan semua layanan lain (lihat record_to_rows).
+CREATE VIEW IF NOT EXISTS v_ina AS
+SELECT
+    pc.no_pkk           AS "No PKK",
+    pc.nama_kapal       AS "Nama Kapal",
+    pc.eta              AS "ETA",
+    pc.etd              AS "ETD",
+    pc.nama_perusahaan  AS "Nama Perusahaan",
+    pc.gt               AS "GT",
+    pc.jenis_trayek     AS "Jenis Trayek",
+    pc.singgah          AS "Singgah",
+    CASE WHEN s.kelompok = 'Lainnya' THEN s.layanan ELSE s.kelompok END AS "Tipe",
+    s.layanan           AS "Layanan",
+    s.verifikator       AS "Verifikator",
+    s.nomor_produk      AS "Nomor Produk",
+    s.lokasi_sandar     AS "Lokasi Sandar",
+    s.nomor_produk      AS "Nomor SPK",
+    CASE WHEN s.nomor_produk <> '' THEN s.waktu_permohonan ELSE '' END AS "Waktu SPK",
+    s.kategori_spk      AS "Kategori SPK",
+    pc.kode_pelabuhan, pc.tahun, pc.bulan, pc.jenis
+FROM services s
+JOIN port_calls pc ON pc.no_pkk = s.no_pkk
+WHERE s.layanan = 'SPK PANDU' AND (s.kelompok = 'Lainnya' OR s.urutan = 0);
+"""
+
+
+def _split_sql(script: str) -> List[str]:
+    # pecah script per statement (aman untuk ';' di dalam komentar/string)
+    statements = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    return statements
+
+
+def open_store(db_path: str) -> sqlite3.Connection:
+    """Buka (dan buat jika perlu) database SQLite. Aman dipakai dari beberapa proses (WAL)."""
+    conn = sqlite3.connect(db_path, timeout=120)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    # BEGIN IMMEDIATE: hanya satu proses yang membuat schema
+    # (executescript akan commit sendiri, jadi statement dijalankan satu per satu)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in _split_sql(STORE_SCHEMA):
+            conn.execute(statement)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        conn.close()
+        raise
+    return conn
+
+
+def _vessel_from_record(record: dict) -> dict:
+    ship_info = record["ship_info"]
+    bendera, call_sign, imo = _split_slash(ship_info.get("Bendera / Call Sign / IMO", ""), 3)
+    gt, dwt = _split_slash(ship_info.get("GT / DWT", ""), 2)
+    draft_depan, draft_belakang, draft_max = _split_slash(ship_info.get("Draft Depan / Belakang / Max", ""), 3)
+    panjang, lebar = _split_slash(ship_info.get("Panjang / Lebar", ""), 2)
+    if imo and imo not in ("-", "0"):
+        vessel_key = imo
+    elif call_sign and call_sign != "-":
+        vessel_key = f"CS:{call_sign}"
+    elif record["nama_kapal"]:
+        vessel_key = f"NAMA:{record['nama_kapal']}"
+    else:
+        vessel_key = None  # tanpa identitas: tidak disimpan di vessels
+    return {
+        "vessel_key": vessel_key, "imo": imo, "call_sign": call_sign,
+        "nama_kapal": record["nama_kapal"], "bendera": bendera, "gt": gt, "dwt": dwt,
+        "panjang": panjang, "lebar": lebar, "draft_depan": draft_depan,
+        "draft_belakang": draft_belakang, "draft_max": draft_max,
+    }
+
+
+def store_records(conn: sqlite3.Connection, records: List[dict], kode: str, tahun: int, bulan: int, jenis: str) -> int:
+    """
+    Upsert satu batch record PKK (hasil fetch_pkk_record) dalam satu transaksi.
+    Kapal di-upsert per vessel_key dan hanya ditimpa oleh kunjungan yang tidak
+    lebih lama (last_seen), berapa pun urutan unit dikerjakan; kunjungan per
+    No PKK, dan baris layanan suatu PKK selalu diganti seluruhnya dengan hasil
+    scrape terbaru.
+    """
+    if not records:
+        return 0
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    last_seen = f"{tahun:04d}-{bulan:02d}"
+    vessel_rows = []
+    call_rows = []
+    service_rows = []
+    for rec in records:
+        vessel = _vessel_from_record(rec)
+        if vessel["vessel_key"] is not None:
+            vessel["last_seen"] = last_seen
+            vessel["updated_at"] = now
+            vessel_rows.append(vessel)
+        dates = rec["dates"]
+        status = rec["status"]
+        call_rows.append({
+            "no_pkk": rec["no_pkk"], "vessel_key": vessel["vessel_key"], "nama_kapal": rec["nama_kapal"],
+            "kode_pelabuhan": kode, "tahun": tahun, "bulan": bulan, "jenis": jenis,
+            "nama_perusahaan": rec["ship_info"].get("Nama Perusahaan", ""),
+            "eta": dates.get("ETA", ""), "etd": dates.get("ETD", ""),
+            "jenis_trayek": dates.get("Jenis Trayek", ""), "singgah": dates.get("Singgah", ""),
+            "gt": vessel["gt"], "dwt": vessel["dwt"], "draft_depan": vessel["draft_depan"],
+            "draft_belakang": vessel["draft_belakang"], "draft_max": vessel["draft_max"],
+            "status_kedatangan": status.get("Status Kedatangan", ""),
+            "status_keberangkatan": status.get("Status Keberangkatan", ""),
+            "detail_json": json.dumps(dates, ensure_ascii=False), "updated_at": now,
+        })
+        for svc in rec["services"]:
+            service_rows.append((
+                rec["no_pkk"], svc["Kelompok"], svc["Urutan"], svc["Layanan"],
+                svc["Waktu Permohonan"], svc["Waktu Persetujuan"], svc["Proses"], svc["Status"],
+                svc["Verifikator"], svc["Nomor Produk"], svc["Lokasi Sandar"], svc["Status Integrasi"],
+                kategori_spk(svc["Verifikator"]) if svc["Layanan"] == "SPK PANDU" else "",
+            ))
+
+    with conn:  # satu transaksi per batch
+        conn.executemany(
+            """INSERT INTO vessels (vessel_key, imo, call_sign, nama_kapal, bendera, gt, dwt, panjang, lebar,
+                                    draft_depan, draft_belakang, draft_max, last_seen, updated_at)
+               VALUES (:vessel_key, :imo, :call_sign, :nama_kapal, :bendera, :gt, :dwt, :panjang, :lebar,
+                       :draft_depan, :draft_belakang, :draft_max, :last_seen, :updated_at)
+               ON CONFLICT(vessel_key) DO UPDATE SET
+                   imo=excluded.imo, call_sign=excluded.call_sign, nama_kapal=excluded.nama_kapal,
+                   bendera=excluded.bendera, gt=excluded.gt, dwt=excluded.dwt, panjang=excluded.panjang,
+                   lebar=excluded.lebar, draft_depan=excluded.draft_depan,
+                   draft_belakang=excluded.draft_belakang, draft_max=excluded.draft_max,
+                   last_seen=excluded.last_seen, updated_at=excluded.updated_at
+               WHERE excluded.last_seen >= vessels.last_seen""",
+            vessel_rows,
+        )
+        conn.executemany(
+            """INSERT INTO port_calls (no_pkk, vessel_key, nama_kapal, kode_pelabuhan, tahun, bulan, jenis,
+                                       nama_perusahaan, eta, etd, jenis_trayek, singgah, gt, dwt, draft_depan,
+                                       draft_belakang, draft_max, status_kedatangan, status_keberangkatan,
+                                       detail_json, updated_at)
+               VALUES (:no_pkk, :vessel_key, :nama_kapal, :kode_pelabuhan, :tahun, :bulan, :jenis,
+                       :nama_perusahaan, :eta, :etd, :jenis_trayek, :singgah, :gt, :dwt, :draft_depan,
+                       :draft_belakang, :draft_max, :status_kedatangan, :status_keberangkatan,
+                       :detail_json, :updated_at)
+               ON CONFLICT(no_pkk) DO UPDATE SET
+                   vessel_key=excluded.vessel_key, nama_kapal=excluded.nama_kapal,
+                   kode_pelabuhan=excluded.kode_pelabuhan, tahun=excluded.tahun, bulan=excluded.bulan,
+                   jenis=excluded.jenis, nama_perusahaan=excluded.nama_perusahaan, eta=excluded.eta,
+                   etd=excluded.etd, jenis_trayek=excluded.jenis_trayek, singgah=excluded.singgah,
+                   gt=excluded.gt, dwt=excluded.dwt, draft_depan=excluded.draft_depan,
+                   draft_belakang=excluded.draft_belakang, draft_max=excluded.draft_max,
+                   status_kedatangan=excluded.status_kedatangan,
+                   status_keberangkatan=excluded.status_keberangkatan,
+                   detail_json=excluded.detail_json, updated_at=excluded.updated_at""",
+            call_rows,
+        )
+        conn.executemany("DELETE FROM services WHERE no_pkk = ?", [(r["no_pkk"],) for r in call_rows])
+        conn.executemany(
+            """INSERT OR REPLACE INTO services (no_pkk, kelompok, urutan, layanan, waktu_permohonan,
+                                                waktu_persetujuan, proses, status, verifikator, nomor_produk,
+                                                lokasi_sandar, status_integrasi, kategori_spk)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            service_rows,
+        )
+    return len(records)
+
+
+def export_csv_from_store(conn: sqlite3.Connection, out_path: str, kode_list: Optional[List[str]] = None,
+                          tahun: Optional[int] = None, bulan_list: Optional[List[int]] = None,
+                          jenis_list: Optional[List[str]] = None) -> int:
+    """Tulis ina.csv dari view v_ina (tanpa scraping ulang). Mengembalikan jumlah baris."""
+    where = []
+    params: list = []
+    for col, values in (("kode_pelabuhan", kode_list), ("bulan", bulan_list), ("jenis", jenis_list)):
+        if values:
+            where.append(f"{col} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if tahun is not None:
+        where.append("tahun = ?")
+        params.append(tahun)
+    cols = ", ".join(f'"{c}"' for c in CSV_COLUMNS)
+    sql = f"SELECT {cols} FROM v_ina"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY kode_pelabuhan, tahun, bulan, jenis, \"No PKK\", \"Tipe\""
+    count = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for row in conn.execute(sql, params):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
 async def test_single_pkk(npk: str):
     """Test function for a single PKK"""
     headers = {
@@ -598,39 +1223,514 @@ async def test_single_pkk(npk: str):
         print(f"Total rows for {npk}: {len(rows)}")
         for row in rows:
             print(f"  Tipe: {row.get('Tipe', 'N/A')}, Status: {row.get('Status', 'N/A')}, Layanan: {row.get('Layanan', 'N/A')}")
-async def gather_all_details(session: aiohttp.ClientSession, pkk_list: List[str]) -> List[dict]:
-    semaphore = asyncio.Semaphore(100)  # Limit concurrency - balanced for speed and stability
-    results = []
+# ---------------------------------------------------------------------------
+# Layanan lookup PKK (--serve): session hangat, coalescing, cache TTL pendek
+# ---------------------------------------------------------------------------
+
+class PkkLookupService:
+    """
+    Lookup PKK on-demand di atas fetch_pkk_record.
+    - Hasil disimpan di cache TTL pendek (LRU, max_entries).
+    - Request bersamaan untuk PKK yang sama digabung menjadi satu fetch upstream.
+    - PKK tidak ditemukan (None) dan fetch yang gagal (PkkFetchError) tidak di-cache.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, ttl: float = 300.0, max_entries: int = 5000,
+                 concurrency: int = 20, hedger: Optional[LatencyHedger] = None):
+        self.session = session
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hedger = hedger
+        self._cache: "collections.OrderedDict[str, Tuple[float, dict]]" = collections.OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def _fetch(self, npk: str) -> Optional[dict]:
+        async with self._semaphore:
+            record = await fetch_pkk_record(self.session, npk, self.hedger, raise_on_fetch_error=True)
+        if record is not None:
+            self._cache[npk] = (time.monotonic() + self.ttl, record)
+            self._cache.move_to_end(npk)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return record
+
+    async def lookup(self, npk: str) -> Optional[dict]:
+        entry = self._cache.get(npk)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._cache.move_to_end(npk)
+                return entry[1]
+            del self._cache[npk]
+
+        fut = self._inflight.get(npk)
+        if fut is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            fut = asyncio.ensure_future(self._fetch(npk))
+            self._inflight[npk] = fut
+            fut.add_done_callback(lambda _f, key=npk: self._inflight.pop(key, None))
+        # shield: klien yang putus tidak membatalkan fetch yang dipakai bersama
+        return await asyncio.shield(fut)
+
+    async def lookup_many(self, npks: List[str]) -> Dict[str, object]:
+        """Per PKK: record, None (tidak ditemukan) atau PkkFetchError."""
+        unique = list(dict.fromkeys(npks))
+        records = await asyncio.gather(*[self.lookup(npk) for npk in unique], return_exceptions=True)
+        for record in records:
+            if isinstance(record, BaseException) and not isinstance(record, PkkFetchError):
+                raise record
+        return dict(zip(unique, records))
+
+    def stats(self) -> dict:
+        return {"cache_entries": len(self._cache), "inflight": len(self._inflight), "hits": self.hits,
+                "misses": self.misses, "coalesced": self.coalesced, "ttl": self.ttl}
+
+
+def _lookup_payload(npk: str, record: Optional[dict], full: bool = False,
+                    error: Optional[PkkFetchError] = None) -> dict:
+    # status: "found", "not_found" (halaman tanpa PKK) atau "error" (upstream gagal, coba lagi)
+    if error is not None:
+        status = "error"
+    else:
+        status = "found" if record is not None else "not_found"
+    payload = {"nomor_pkk": npk, "status": status, "found": record is not None,
+               "rows": record_to_rows(record) if record is not None else []}
+    if error is not None:
+        payload["error"] = str(error)
+    if full and record is not None:
+        payload["record"] = record
+    return payload
+
 
-    async def bounded_process(npk: str):
-        async with semaphore:
-            rows = await process_pkk(session, npk)
-            if rows:
-                results.extend(rows)
+def serve_lookup(host: str = "127.0.0.1", port: int = 8080, ttl: float = 300.0,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 request_timeout: float = REQUEST_TIMEOUT, hedge_percentile: Optional[float] = None,
+                 hedge_max_rate: float = 0.05):
+    """
+    Jalankan layanan HTTP lokal:
+      GET  /pkk/{nomor_pkk}[?full=1]          -> satu PKK (404 tidak ditemukan, 502 upstream gagal)
+      POST /pkk  {"nomor_pkk": [..], "full"?}  -> batch, "status" per PKK
+      GET  /stats                              -> statistik cache
+    """
+    from aiohttp import web
 
-    await asyncio.gather(*[bounded_process(npk) for npk in pkk_list])
-    return results
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
 
-def run_for_port(kode: str, bulan_list: List[int], jenis_list: List[str], tahun: int) -> List[dict]:
-    async def inner():
+    async def session_ctx(app):
         connector = aiohttp.TCPConnector(limit=0, force_close=False, ttl_dns_cache=300)
-        headers = {
-            "User-Agent": "Mozilla/5.0 (compatible; Scraper/1.0; +https://example.org/bot)"
+        timeout = make_client_timeout(connect_timeout, read_timeout, request_timeout)
+        hedger = LatencyHedger(hedge_percentile, hedge_max_rate) if hedge_percentile is not None else None
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout,
+                                         trust_env=True) as session:
+            app["service"] = PkkLookupService(session, ttl=ttl, hedger=hedger)
+            yield
+
+    async def get_one(request):
+        npk = request.match_info["nomor_pkk"]
+        try:
+            record = await request.app["service"].lookup(npk)
+        except PkkFetchError as e:
+            return web.json_response(_lookup_payload(npk, None, error=e), status=502, dumps=dumps)
+        payload = _lookup_payload(npk, record, request.query.get("full") == "1")
+        return web.json_response(payload, status=200 if record is not None else 404, dumps=dumps)
+
+    async def post_batch(request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "body harus JSON"}, status=400, dumps=dumps)
+        if isinstance(body, list):
+            npks, full = body, False
+        elif isinstance(body, dict):
+            npks, full = body.get("nomor_pkk") or [], bool(body.get("full"))
+        else:
+            return web.json_response({"error": "body harus list atau object JSON"}, status=400, dumps=dumps)
+        if not isinstance(npks, list) or not all(isinstance(x, str) for x in npks):
+            return web.json_response({"error": "nomor_pkk harus list string"}, status=400, dumps=dumps)
+        results = await request.app["service"].lookup_many(npks)
+        payloads = [_lookup_payload(k, None, error=v) if isinstance(v, PkkFetchError) else _lookup_payload(k, v, full)
+                    for k, v in results.items()]
+        return web.json_response({"results": payloads}, dumps=dumps)
+
+    async def get_stats(request):
+        return web.json_response(request.app["service"].stats(), dumps=dumps)
+
+    app = web.Application()
+    app.cleanup_ctx.append(session_ctx)
+    app.router.add_get("/pkk/{nomor_pkk}", get_one)
+    app.router.add_post("/pkk", post_batch)
+    app.router.add_get("/stats", get_stats)
+    print(f"PKK lookup service → http://{host}:{port} (cache TTL {ttl:g}s)")
+    web.run_app(app, host=host, port=port, print=None)
+
+
+DETAIL_CONCURRENCY = 100  # Limit concurrency - balanced for speed and stability
+STORE_BATCH_SIZE = 500     # record per transaksi SQLite saat streaming
+
+
+async def iter_records(session: aiohttp.ClientSession, pkk_list: Iterable[str],
+                       hedger: Optional[LatencyHedger] = None, stop_at: Optional[float] = None,
+                       skipped: Optional[List[str]] = None, failed: Optional[List[str]] = None,
+                       concurrency: int = DETAIL_CONCURRENCY) -> AsyncIterator[dict]:
+    """
+    Fetch PKK dengan pool worker tetap dan antrean terbatas, lalu yield record
+    begitu selesai. Jumlah task dan record yang tertahan di memori tetap
+    (maks. concurrency worker + 2*concurrency di tiap antrean), berapa pun
+    panjang pkk_list.
+
+    Jika stop_at (epoch detik) diberikan, PKK yang belum mulai saat batas itu
+    lewat tidak di-fetch dan dicatat di skipped. PKK yang gagal di-fetch atau
+    di-parse (fetch_pkk_record mengembalikan None) dicatat di failed.
+    """
+    if hasattr(pkk_list, "__len__"):
+        concurrency = max(1, min(concurrency, len(pkk_list)))
+    todo: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    done: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    finished = object()
+
+    async def producer():
+        for npk in pkk_list:
+            await todo.put(npk)
+        for _ in range(concurrency):
+            await todo.put(None)
+
+    async def worker():
+        try:
+            while True:
+                npk = await todo.get()
+                if npk is None:
+                    break
+                if stop_at is not None and time.time() >= stop_at:
+                    if skipped is not None:
+                        skipped.append(npk)
+                    continue
+                record = await fetch_pkk_record(session, npk, hedger)
+                if record:
+                    await done.put(record)
+                elif failed is not None:
+                    failed.append(npk)
+        except Exception as e:
+            await done.put(e)
+            return
+        await done.put(finished)
+
+    tasks = [asyncio.ensure_future(producer())]
+    tasks += [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    try:
+        remaining = concurrency
+        while remaining:
+            item = await done.get()
+            if item is finished:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ---------------------------------------------------------------------------
+# Proses worker: satu event loop, session, hedger dan koneksi DB per proses,
+# dipakai ulang oleh semua unit yang dikerjakan proses itu
+# ---------------------------------------------------------------------------
+
+_WORKER: dict = {}
+
+
+def init_worker(db_path: Optional[str] = None, profile_dir: Optional[str] = None, profile_memory: bool = False,
+                connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                request_timeout: float = REQUEST_TIMEOUT, hedge_percentile: Optional[float] = None,
+                hedge_max_rate: float = 0.05):
+    """
+    Initializer ProcessPoolExecutor. Session (koneksi hangat) dan LatencyHedger
+    (persentil yang sudah dipelajari) bertahan lintas unit sampai proses selesai.
+    """
+    if profile_dir:
+        PROFILER.start(profile_memory)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if profile_dir:
+        loop.set_debug(True)
+        loop.slow_callback_duration = SLOW_CALLBACK_SECONDS
+
+    async def open_session() -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(limit=0, force_close=False, ttl_dns_cache=300)
+        timeout = make_client_timeout(connect_timeout, read_timeout, request_timeout)
+        return aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout, trust_env=True)
+
+    _WORKER.update(
+        loop=loop,
+        session=loop.run_until_complete(open_session()),
+        hedger=LatencyHedger(hedge_percentile, hedge_max_rate) if hedge_percentile is not None else None,
+        conn=open_store(db_path) if db_path else None,
+        profile_dir=profile_dir,
+    )
+    # dijalankan saat proses keluar normal (shutdown executor / akhir interpreter)
+    multiprocessing.util.Finalize(None, close_worker, exitpriority=10)
+
+
+def close_worker():
+    if not _WORKER:
+        return
+    loop = _WORKER["loop"]
+    loop.run_until_complete(_WORKER["session"].close())
+    loop.close()
+    if _WORKER["conn"] is not None:
+        _WORKER["conn"].close()
+    if _WORKER["hedger"] is not None:
+        print(f"[worker {os.getpid()}] {_WORKER['hedger'].summary()}")
+    if _WORKER["profile_dir"]:
+        PROFILER.stop(_WORKER["profile_dir"], "worker")
+    _WORKER.clear()
+
+
+async def _scrape_unit(kode: str, tahun: int, bulan: int, jenis: str, pkk_list: List[str],
+                       parts_dir: str, stop_at: Optional[float] = None) -> dict:
+    session = _WORKER["session"]
+    hedger = _WORKER["hedger"]
+    conn = _WORKER["conn"]
+    t0 = time.perf_counter()
+    result = {"kode": kode, "tahun": tahun, "bulan": bulan, "jenis": jenis, "rows": 0, "rows_path": None,
+              "pkk_total": len(pkk_list), "pkk_skipped": 0, "pkk_failed": 0, "failed_pkk": [],
+              "seconds": 0.0, "complete": True}
+    if stop_at is not None and time.time() >= stop_at:
+        # belum ada PKK yang dikerjakan: scheduler mencatatnya sebagai dilewati
+        result["pkk_skipped"] = len(pkk_list)
+        result["complete"] = False
+        return result
+
+    def flush_batch(batch: List[dict]):
+        try:
+            with PROFILER.stage("write"):
+                store_records(conn, batch, kode, tahun, bulan, jenis)
+        except sqlite3.Error as e:
+            print(f"[WARN] Gagal simpan ke DB {kode} {tahun}-{bulan:02d} {jenis}: {e}")
+
+    print(f"Fetching {len(pkk_list)} PKK for {kode} {tahun}-{bulan:02d} {jenis}...")
+    skipped: List[str] = []
+    failed: List[str] = []
+    batch: List[dict] = []
+    # Baris CSV langsung ditulis ke file part (tanpa header) per record; proses
+    # utama menyambungnya ke ina.csv, jadi baris tidak menumpuk di memori
+    # atau dikirim lewat pickle.
+    parts_path = os.path.join(parts_dir, f"{kode}-{tahun}{bulan:02d}-{jenis}.csv")
+    with open(parts_path, "w", newline="", encoding="utf-8") as part_file:
+        writer = csv.DictWriter(part_file, fieldnames=CSV_COLUMNS)
+        async for record in iter_records(session, pkk_list, hedger, stop_at, skipped, failed):
+            with PROFILER.stage("unpivot"):
+                rows = record_to_rows(record)
+            with PROFILER.stage("write"):
+                writer.writerows(rows)
+            result["rows"] += len(rows)
+            if conn is not None:
+                batch.append(record)
+                if len(batch) >= STORE_BATCH_SIZE:
+                    flush_batch(batch)
+                    batch = []
+    if conn is not None:
+        flush_batch(batch)
+    if result["rows"]:
+        result["rows_path"] = parts_path
+    else:
+        os.remove(parts_path)
+    if failed:
+        print(f"[WARN] {len(failed)} PKK gagal untuk {kode} {tahun}-{bulan:02d} {jenis}")
+    result["pkk_skipped"] = len(skipped)
+    result["pkk_failed"] = len(failed)
+    result["failed_pkk"] = failed
+    result["complete"] = not skipped and not failed
+    result["seconds"] = time.perf_counter() - t0
+    return result
+
+
+def run_unit(kode: str, bulan: int, jenis: str, tahun: int, pkk_list: List[str], parts_dir: str,
+             stop_at: Optional[float] = None) -> dict:
+    """
+    Satu unit kerja scheduler, dijalankan di worker yang sudah disiapkan
+    init_worker (di luar pool, worker diinisialisasi dengan opsi default).
+    Baris CSV ditulis ke result["rows_path"] di parts_dir; result["rows"]
+    hanya jumlahnya.
+    """
+    if not _WORKER:
+        init_worker()
+    return _WORKER["loop"].run_until_complete(_scrape_unit(kode, tahun, bulan, jenis, pkk_list, parts_dir, stop_at))
+
+
+# ---------------------------------------------------------------------------
+# Scheduler run (--deadline): kerjakan unit paling bernilai dulu
+# ---------------------------------------------------------------------------
+
+DEADLINE_MARGIN_SECONDS = 120.0  # cadangan untuk menulis output sebelum deadline
+
+
+LIST_CONCURRENCY = 8               # request daftar PKK paralel di proses utama
+
+
+def previous_period(tahun: int, bulan: int) -> Tuple[int, int]:
+    return (tahun, bulan - 1) if bulan > 1 else (tahun - 1, 12)
+
+
+class RunScheduler:
+    """
+    Urutkan unit kerja (pelabuhan, tahun, bulan, jenis) berdasarkan nilai.
+    Daftar PKK semua unit diambil dulu (list_units), jadi urutan dan perkiraan
+    durasi memakai jumlah PKK yang sebenarnya: periode terbaru yang diminta
+    (bulan berjalan, atau bulan terakhir sebelum hari ini), lalu bulan
+    sebelumnya (bisa jatuh di tahun sebelumnya), lalu sisanya; di tiap tingkat
+    pelabuhan dengan PKK terbanyak dulu. Sebelum unit
+    dimulai, durasinya diperkirakan dari jumlah PKK-nya dan throughput (detik
+    per PKK) yang terukur selama run; unit yang tidak akan selesai sebelum
+    deadline dilewati dan dicatat.
+    """
+
+    def __init__(self, kode_list: List[str], periods: List[Tuple[int, int]], jenis_list: List[str],
+                 deadline_ts: Optional[float] = None, margin: float = DEADLINE_MARGIN_SECONDS,
+                 today: Optional[datetime.date] = None):
+        self.periods = sorted(set(periods))
+        self.deadline_ts = deadline_ts
+        self.margin = margin
+        self._port_rank = {kode: i for i, kode in enumerate(kode_list)}
+        today = today or datetime.date.today()
+        started = [p for p in self.periods if p <= (today.year, today.month)]
+        self._latest = started[-1] if started else None
+        self._previous = previous_period(*self._latest) if started else None
+        self.units = [(kode, tahun, bulan, jenis) for kode in kode_list for tahun, bulan in self.periods
+                      for jenis in jenis_list]
+        self.pkk_lists: Dict[Tuple[str, int, int, str], List[str]] = {}
+        self._port_volume: Dict[str, int] = {}
+        self.pending: List[Tuple[str, int, int, str]] = []
+        self.done: List[dict] = []
+        self.skipped: List[dict] = []
+        self.failed: List[dict] = []
+        self._total_pkk = 0
+        self._total_seconds = 0.0
+
+    @property
+    def stop_at(self) -> Optional[float]:
+        return self.deadline_ts - self.margin if self.deadline_ts is not None else None
+
+    def list_units(self, threads: int = LIST_CONCURRENCY):
+        """
+        Ambil daftar PKK semua unit secara paralel, lalu susun antrean.
+        Unit yang daftarnya gagal diambil dicatat sebagai gagal, yang belum
+        selesai saat deadline dilewati, dan unit tanpa PKK langsung selesai.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        futures = {executor.submit(fetch_pkk_list, kode, tahun, bulan, jenis): (kode, tahun, bulan, jenis)
+                   for kode, tahun, bulan, jenis in self.units}
+        timeout = max(0.0, self.stop_at - time.time()) if self.stop_at is not None else None
+        try:
+            for fut in concurrent.futures.as_completed(futures, timeout=timeout):
+                unit = futures.pop(fut)
+                try:
+                    self.pkk_lists[unit] = fut.result()
+                except Exception as e:
+                    print(f"[WARN] Gagal JSON {unit[0]} {unit[3]} {unit[1]}-{unit[2]:02d}: {e}")
+                    self.record_failure(unit, e)
+        except concurrent.futures.TimeoutError:
+            pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for unit in futures.values():
+            self._skip(unit, "daftar PKK belum diambil saat deadline", None)
+
+        for (kode, _tahun, _bulan, _jenis), pkk_list in self.pkk_lists.items():
+            self._port_volume[kode] = self._port_volume.get(kode, 0) + len(pkk_list)
+        for unit in self.units:
+            if unit not in self.pkk_lists:
+                continue
+            if self.pkk_lists[unit]:
+                self.pending.append(unit)
+            else:
+                kode, tahun, bulan, jenis = unit
+                self.done.append({"kode": kode, "tahun": tahun, "bulan": bulan, "jenis": jenis, "rows": 0,
+                                  "pkk_total": 0, "pkk_skipped": 0,
+                                  "pkk_failed": 0, "failed_pkk": [], "seconds": 0.0, "complete": True})
+        self.pending.sort(key=self._priority)
+
+    def _priority(self, unit: Tuple[str, int, int, str]) -> tuple:
+        kode, tahun, bulan, _jenis = unit
+        if (tahun, bulan) == self._latest:
+            tier = 0
+        elif (tahun, bulan) == self._previous:
+            tier = 1
+        else:
+            tier = 2
+        volume = self._port_volume.get(kode, 0)
+        return (tier, -volume, self._port_rank.get(kode, 0), -tahun, -bulan)
+
+    def estimate_seconds(self, unit: Tuple[str, int, int, str]) -> Optional[float]:
+        """Perkiraan durasi unit dari jumlah PKK-nya; None jika belum ada data throughput."""
+        if not self._total_pkk:
+            return None
+        return len(self.pkk_lists.get(unit, ())) * (self._total_seconds / self._total_pkk)
+
+    def next_unit(self, now: Optional[float] = None) -> Optional[Tuple[str, int, int, str]]:
+        """Ambil unit berikutnya yang masih muat sebelum deadline; sisanya dicatat sebagai skipped."""
+        now = time.time() if now is None else now
+        while self.pending:
+            unit = self.pending.pop(0)
+            if self.stop_at is None:
+                return unit
+            est = self.estimate_seconds(unit)
+            if now >= self.stop_at:
+                self._skip(unit, "deadline tercapai", est)
+            elif est is not None and now + est > self.stop_at:
+                self._skip(unit, "perkiraan durasi melewati deadline", est)
+            else:
+                return unit
+        return None
+
+    def _skip(self, unit: Tuple[str, int, int, str], reason: str, est: Optional[float]):
+        kode, tahun, bulan, jenis = unit
+        self.skipped.append({"kode": kode, "tahun": tahun, "bulan": bulan, "jenis": jenis, "alasan": reason,
+                             "pkk_total": len(self.pkk_lists[unit]) if unit in self.pkk_lists else None,
+                             "perkiraan_detik": round(est, 1) if est is not None else None})
+
+    def record(self, result: dict):
+        if result["pkk_total"] and result["pkk_skipped"] == result["pkk_total"]:
+            # deadline lewat sebelum worker sempat memulai unit ini
+            self._skip((result["kode"], result["tahun"], result["bulan"], result["jenis"]),
+                       "deadline tercapai sebelum unit dimulai", None)
+            return
+        self.done.append({k: v for k, v in result.items() if k != "rows_path"})
+        done_pkk = result["pkk_total"] - result["pkk_skipped"]
+        if done_pkk > 0:
+            self._total_pkk += done_pkk
+            self._total_seconds += result["seconds"]
+
+    def record_failure(self, unit: Tuple[str, int, int, str], error: BaseException):
+        kode, tahun, bulan, jenis = unit
+        self.failed.append({"kode": kode, "tahun": tahun, "bulan": bulan, "jenis": jenis, "error": repr(error)})
+
+    def report(self) -> dict:
+        return {
+            "periode": [f"{tahun}-{bulan:02d}" for tahun, bulan in self.periods],
+            "deadline": datetime.datetime.fromtimestamp(self.deadline_ts).isoformat(timespec="seconds")
+            if self.deadline_ts is not None else None,
+            "selesai": [u for u in self.done if u["complete"]],
+            "sebagian": [u for u in self.done if not u["complete"]],
+            "dilewati": self.skipped,
+            "gagal": self.failed,
+            "pkk_per_detik_per_worker": round(self._total_pkk / self._total_seconds, 3) if self._total_seconds else None,
         }
-        rows = []
-        async with aiohttp.ClientSession(headers=headers, connector=connector, trust_env=True) as session:
-            for bulan in bulan_list:
-                for jenis in jenis_list:
-                    print(f"Fetching for {kode} {tahun}-{bulan:02d} {jenis}...")
-                    pkk_list = scrape_pkk_list(kode, tahun, bulan, jenis)
-                    if not pkk_list:
-                        print(f"No PKK for {kode} {tahun}-{bulan:02d} {jenis}")
-                        continue
-                    print(f"Found {len(pkk_list)} PKK for {kode} {tahun}-{bulan:02d} {jenis}")
-                    batch_rows = await gather_all_details(session, pkk_list)
-                    rows.extend(batch_rows)
-        return rows
-    return asyncio.run(inner())
+
+def _percentile_arg(value: str) -> float:
+    p = float(value)
+    if not 0 < p < 100:
+        raise argparse.ArgumentTypeError(f"persentil harus di antara 0 dan 100 (eksklusif), bukan {value}")
+    return p
+
 
 def main():
     parser = argparse.ArgumentParser(description="Scrape PKK details from INAPORTNET")
@@ -639,8 +1739,36 @@ def main():
     parser.add_argument("--bulan", type=int, nargs='*', help="Bulan (opsional, default semua bulan)")
     parser.add_argument("--jenis", nargs='*', default=["dn", "ln"], help="Jenis: dn atau ln (default keduanya)")
     parser.add_argument("--test-pkk", help="Test single PKK number and save to CSV")
+    parser.add_argument("--db", help="Simpan juga semua data (kapal, kunjungan, semua layanan) ke SQLite ini")
+    parser.add_argument("--csv-from-db", action="store_true", help="Tanpa scraping: tulis ina.csv dari --db (filter --kode/--tahun/--bulan/--jenis)")
+    parser.add_argument("--profile", nargs="?", const="profile_report.txt", metavar="REPORT",
+                        help="Profil semua worker (cProfile, waktu per tahap, slow callback asyncio) ke satu file laporan")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Dengan --profile: ukur juga memori per tahap (tracemalloc; jauh lebih lambat, jalankan terpisah)")
+    parser.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT, help="Batas waktu connect per request detail (detik)")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT, help="Batas waktu baca socket per request detail (detik)")
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT, help="Batas waktu total per request detail (detik)")
+    parser.add_argument("--hedge", nargs="?", type=_percentile_arg, const=95.0, metavar="PERSENTIL",
+                        help="Kirim request duplikat jika detail lebih lambat dari persentil latensi ini (default 95)")
+    parser.add_argument("--hedge-max-rate", type=float, default=0.05, help="Maksimum fraksi request yang boleh di-hedge (default 0.05)")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8080", metavar="HOST:PORT",
+                        help="Jalankan layanan lookup PKK lokal (default 127.0.0.1:8080)")
+    parser.add_argument("--cache-ttl", type=float, default=300.0, help="TTL cache layanan lookup (detik)")
+    parser.add_argument("--deadline", type=float, metavar="MENIT",
+                        help="Batas waktu run (menit dari mulai); unit yang tidak muat dilewati dan dilaporkan")
+    parser.add_argument("--workers", type=int, default=4, help="Jumlah proses worker (default 4)")
     args = parser.parse_args()
 
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        if not port.isdigit() or not 0 < int(port) < 65536:
+            parser.error(f"--serve butuh HOST:PORT atau :PORT, bukan {args.serve!r}")
+        serve_lookup(host or "127.0.0.1", int(port), ttl=args.cache_ttl,
+                     connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                     request_timeout=args.request_timeout, hedge_percentile=args.hedge,
+                     hedge_max_rate=args.hedge_max_rate)
+        return
+
     if args.test_pkk:
         # Test single PKK and save to CSV
         async def run_test():
@@ -666,30 +1794,125 @@ def main():
     else:
         kode_list = args.kode
 
-    bulan_list = args.bulan if args.bulan else list(range(1, datetime.datetime.now().month + 1))
+    now = datetime.datetime.now()
+    bulan_list = args.bulan if args.bulan else list(range(1, (now.month if args.tahun == now.year else 12) + 1))
+    periods = [(args.tahun, bulan) for bulan in bulan_list]
+    if not args.bulan and args.tahun == now.year:
+        # bulan lalu selalu ikut di-scrape ulang, termasuk Desember tahun lalu saat Januari
+        periods.append(previous_period(now.year, now.month))
     jenis_list = args.jenis if args.jenis else ["dn", "ln"]
 
-    # Use multiprocessing for parallel port processing
-    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(run_for_port, kode, bulan_list, jenis_list, args.tahun) for kode in kode_list]
-        all_rows = []
-        for future in concurrent.futures.as_completed(futures):
-            all_rows.extend(future.result())
-
-    if all_rows:
+    if args.csv_from_db:
+        if not args.db:
+            parser.error("--csv-from-db butuh --db")
         out_dir = os.path.dirname(__file__) or "."
         out_path = os.path.join(out_dir, "ina.csv")
+        conn = open_store(args.db)
         try:
-            with open(out_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=list(all_rows[0].keys()))
-                writer.writeheader()
-                writer.writerows(all_rows)
-            print(f"Saved {len(all_rows)} results to {out_path}")
-        except Exception as e:
-            print(f"Failed to save CSV: {e}")
+            n = export_csv_from_store(conn, out_path, None if "all" in args.kode else kode_list,
+                                      args.tahun, args.bulan, jenis_list)
+            print(f"Saved {n} results to {out_path} (dari {args.db})")
+        finally:
+            conn.close()
+        return
+
+    if args.db:
+        # buat schema sekali di proses utama sebelum worker menulis
+        open_store(args.db).close()
+
+    if args.profile_memory and not args.profile:
+        args.profile = "profile_report.txt"
+    profile_dir = None
+    if args.profile:
+        profile_dir = args.profile + ".d"
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    out_dir = os.path.dirname(__file__) or "."
+    out_path = os.path.join(out_dir, "ina.csv")
+    report_path = os.path.join(out_dir, "ina_report.json")
+    deadline_ts = time.time() + args.deadline * 60 if args.deadline else None
+    margin = min(DEADLINE_MARGIN_SECONDS, args.deadline * 60 * 0.1) if args.deadline else DEADLINE_MARGIN_SECONDS
+    scheduler = RunScheduler(kode_list, periods, jenis_list, deadline_ts, margin)
+    worker_args = (args.db, profile_dir, args.profile_memory, args.connect_timeout, args.read_timeout,
+                   args.request_timeout, args.hedge, args.hedge_max_rate)
+
+    # Tulis ina.csv bertahap per unit selesai, supaya run yang terpotong tetap punya output;
+    # worker menulis baris unitnya ke parts_dir dan di sini file itu disambung ke ina.csv
+    parts_dir = out_path + ".parts"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+    total_rows = 0
+    out_file = None
+    try:
+        # Saat profiling worker dibuat dengan spawn: proses hasil fork mewarisi
+        # heap dan tracemalloc proses utama sehingga angka per proses tercampur.
+        mp_context = multiprocessing.get_context("spawn") if profile_dir else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, mp_context=mp_context,
+                                                    initializer=init_worker, initargs=worker_args) as executor:
+            if profile_dir:
+                PROFILER.start(args.profile_memory)
+            scheduler.list_units()
+            print(f"Daftar PKK: {sum(map(len, scheduler.pkk_lists.values()))} PKK di {len(scheduler.pending)} unit "
+                  f"({len(scheduler.units) - len(scheduler.pkk_lists)} unit tanpa daftar)")
+            in_flight = {}
+            while True:
+                while len(in_flight) < args.workers:
+                    unit = scheduler.next_unit()
+                    if unit is None:
+                        break
+                    kode, tahun, bulan, jenis = unit
+                    fut = executor.submit(run_unit, kode, bulan, jenis, tahun,
+                                          scheduler.pkk_lists[unit], parts_dir, scheduler.stop_at)
+                    in_flight[fut] = unit
+                if not in_flight:
+                    break
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    unit = in_flight.pop(fut)
+                    try:
+                        result = fut.result()
+                    except Exception as e:
+                        print(f"[WARN] Unit {unit} gagal: {e}")
+                        scheduler.record_failure(unit, e)
+                        continue
+                    scheduler.record(result)
+                    if not result["rows"]:
+                        continue
+                    with PROFILER.stage("write"):
+                        if out_file is None:
+                            out_file = open(out_path, "w", newline="", encoding="utf-8")
+                            csv.DictWriter(out_file, fieldnames=CSV_COLUMNS).writeheader()
+                        with open(result["rows_path"], newline="", encoding="utf-8") as part_file:
+                            shutil.copyfileobj(part_file, out_file)
+                        out_file.flush()
+                        os.fsync(out_file.fileno())
+                        os.remove(result["rows_path"])
+                    total_rows += result["rows"]
+    finally:
+        if out_file is not None:
+            out_file.close()
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    if total_rows:
+        print(f"Saved {total_rows} results to {out_path}")
     else:
         print("No data to save.")
 
+    report = scheduler.report()
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"Failed to save report: {e}")
+    print(f"Unit selesai: {len(report['selesai'])}, sebagian: {len(report['sebagian'])}, "
+          f"dilewati: {len(report['dilewati'])}, gagal: {len(report['gagal'])} → {report_path}")
+
+    if profile_dir:
+        PROFILER.stop(profile_dir, "main")
+        write_profile_report(profile_dir, args.profile)
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        print(f"Profile report → {args.profile}")
+
 
 if __name__ == "__main__":
     main()